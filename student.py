@@ -1,61 +1,18 @@
 import streamlit as st
 import sqlite3
+import threading
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from math import pi
+import altair as alt
 
 # ==========================================
-# 1. SETUP & DATABASE
+# 1. SETUP
 # ==========================================
 st.set_page_config(page_title="Right Step Preschool Analytics", layout="wide")
 
-def init_db():
-    conn = sqlite3.connect('preschool_data.db', check_same_thread=False) 
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS observations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            student_name TEXT,
-            q1_instructions TEXT,
-            q2_turns TEXT,
-            q3_emotions TEXT,
-            q4_sharing TEXT,
-            q5_space TEXT,
-            q6_focus TEXT,
-            q7_joining TEXT,
-            q8_help TEXT,
-            q9_independence TEXT,
-            q10_persistence TEXT
-        )
-    ''')
-    conn.commit()
-    return conn
-
-conn = init_db()
-
 # ==========================================
-# 2. SCORING FUNCTION
-# ==========================================
-def get_score(text):
-    """Maps qualitative text responses to a quantitative score (1-5)."""
-    mapping = {
-        "Immediately": 5, "After 1 reminder": 4, "After several reminders": 3, "Rarely follows": 2, "Never follows": 1,
-        "Always waits": 5, "Usually waits": 4, "Sometimes waits": 3, "Rarely waits": 2, "Never waits": 1,
-        "Independent": 5, "Mostly independent": 4, "Sometimes needs help": 3, "Often loses control": 2, "Cannot regulate": 1,
-        "Always shares": 5, "Usually shares": 4, "Sometimes shares": 3, "Rarely shares": 2, "Never shares": 1,
-        "Always respects": 5, "Mostly respects": 4, "Sometimes respects": 3, "Rarely respects": 2, "Never respects": 1,
-        "Highly focused": 5, "Mostly focused": 4, "Sometimes focused": 3, "Rarely focused": 2, "Cannot focus": 1,
-        "Eagerly participates": 5, "Usually participates": 4, "Sometimes participates": 3, "Rarely participates": 2, "Does not participate": 1,
-        "Asks independently": 5, "Asks after prompt": 4, "Sometimes asks": 3, "Rarely asks": 2, "Never asks": 1,
-        "Completely independent": 5, "Mostly independent": 4, "Partially independent": 3, "Needs guidance": 2, "Not independent": 1,
-        "Persistent": 5, "Mostly persistent": 4, "Sometimes gives up": 3, "Often gives up": 2, "Does not try": 1
-    }
-    return mapping.get(text, 0)
-
-# ==========================================
-# 3. CATEGORIES AND QUESTIONS
+# 2. CATEGORIES AND QUESTIONS
 # ==========================================
 categories = ["Instructions", "Turns", "Emotions", "Sharing", "Space",
               "Focus", "Joining", "Help", "Indep.", "Persistence"]
@@ -83,62 +40,209 @@ questions = {
                         ["Persistent", "Mostly persistent", "Sometimes gives up", "Often gives up", "Does not try"])
 }
 
+# ==========================================
+# 3. SCORING FUNCTION
+# ==========================================
+# Every question lists its options from best to worst, so an option's position
+# in its own question's list determines its score. The last slot of SCORE_VEC
+# scores unrecognised responses as 0.
+SCORE_VEC = np.array([5, 4, 3, 2, 1, 0])
+OPTION_INDEX = {q: {opt: i for i, opt in enumerate(opts)} for q, (_, opts) in questions.items()}
+# Scores are also persisted as integers next to the text, e.g. q1_instructions -> q1_score
+SCORE_COLS = {q: q.split('_')[0] + '_score' for q in questions}
+
+def score_responses(responses):
+    """Maps a question -> response mapping to a list of quantitative scores (1-5)."""
+    idx = [OPTION_INDEX[q].get(responses[q], -1) for q in questions]
+    return SCORE_VEC[idx].tolist()
+
+def score_columns(responses):
+    """Maps each answered question to its integer score column, e.g. {'q1_score': 5}."""
+    return {SCORE_COLS[q]: int(SCORE_VEC[OPTION_INDEX[q].get(v, -1)])
+            for q, v in responses.items() if q in SCORE_COLS}
+
+def score_case_sql(col, options):
+    """Builds a SQL CASE expression mapping a question's options to scores."""
+    # Option text is embedded as a SQL string literal, so double any single quotes
+    whens = " ".join(f"""WHEN '{opt.replace("'", "''")}' THEN {SCORE_VEC[i]}""" for i, opt in enumerate(options))
+    return f"CASE {col} {whens} ELSE 0 END"
+
 # ==========================================
 # 4. CHART FUNCTIONS (Reusable)
 # ==========================================
 
+# Radar axis angles, closed back onto the first category
+RADAR_ANGLES = np.linspace(0, 2 * np.pi, len(categories), endpoint=False)
+RADAR_ANGLES = np.concatenate([RADAR_ANGLES, RADAR_ANGLES[:1]])
+
+@st.cache_data(show_spinner=False, max_entries=128)
 def create_radar_chart(scores, title, chart_color, label):
-    """Generates a Matplotlib Radar Chart for the given scores."""
-    N = len(categories)
-    angles = [n / float(N) * 2 * pi for n in range(N)]
-    angles += [angles[0]]
-    data = scores + [scores[0]]
+    """Generates a Matplotlib Radar Chart for the given scores (a tuple, so it can be cached)."""
+    data = np.concatenate([scores, scores[:1]])
     
     fig, ax = plt.subplots(figsize=(6, 6), subplot_kw={'projection': 'polar'})
-    ax.plot(angles, data, linewidth=2, linestyle='solid', label=label, color=chart_color)
-    ax.fill(angles, data, chart_color, alpha=0.25)
+    ax.plot(RADAR_ANGLES, data, linewidth=2, linestyle='solid', label=label, color=chart_color)
+    ax.fill(RADAR_ANGLES, data, chart_color, alpha=0.25)
     
-    plt.xticks(angles[:-1], categories, fontsize=10)
+    plt.xticks(RADAR_ANGLES[:-1], categories, fontsize=10)
     ax.set_rlabel_position(30)
     plt.yticks([1, 2, 3, 4, 5], ["1","2","3","4","5"], color="grey", size=8)
     ax.set_ylim(0, 5)
     plt.title(title, size=12, y=1.1)
+    plt.close(fig)
     
     return fig
 
 def create_bar_chart(scores, title):
-    """Generates a Matplotlib Horizontal Bar Chart for the given scores."""
-    fig, ax = plt.subplots(figsize=(8, 5))
+    """Generates an Altair Horizontal Bar Chart for the given scores, rendered in the browser."""
     percentages = [s / 5 * 100 for s in scores]
     colors = ['#4CAF50' if p >= 80 else '#FFC107' if p >= 60 else '#FF5252' for p in percentages]
-    y_pos = np.arange(len(categories))
+    data = pd.DataFrame({
+        "Category": categories,
+        "Performance (%)": percentages,
+        "color": colors,
+        "label": [f"{p:.0f}%" for p in percentages],
+    })
     
-    ax.barh(y_pos, percentages, color=colors)
-    ax.set_yticks(y_pos)
-    ax.set_yticklabels(categories)
-    ax.invert_yaxis()
-    ax.set_xlim(0, 100)
-    ax.set_xlabel("Performance (%)")
-    plt.title(title, size=12)
+    base = alt.Chart(data, title=title).encode(
+        x=alt.X("Performance (%)", scale=alt.Scale(domain=[0, 100])),
+        y=alt.Y("Category", sort=None, title=None),
+    )
+    bars = base.mark_bar().encode(color=alt.Color("color", scale=None))
+    labels = base.mark_text(align='left', dx=3, fontWeight='bold').encode(text="label")
     
-    for i, v in enumerate(percentages):
-        ax.text(v + 1, i + 0.1, f"{v:.0f}%", fontweight='bold')
-        
-    return fig
+    return bars + labels
 
 # ==========================================
 # 5. DATABASE MANAGEMENT FUNCTIONS (NEW)
 # ==========================================
 
-def delete_observation(obs_id):
-    """Deletes a record from the database by ID."""
+@st.cache_resource
+def init_db():
+    """Opens the SQLite connection once and reuses it across reruns."""
+    conn = sqlite3.connect('preschool_data.db', check_same_thread=False) 
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
     c = conn.cursor()
-    c.execute("DELETE FROM observations WHERE id = ?", (obs_id,))
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS observations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            student_name TEXT,
+            q1_instructions TEXT,
+            q2_turns TEXT,
+            q3_emotions TEXT,
+            q4_sharing TEXT,
+            q5_space TEXT,
+            q6_focus TEXT,
+            q7_joining TEXT,
+            q8_help TEXT,
+            q9_independence TEXT,
+            q10_persistence TEXT,
+            q1_score INTEGER,
+            q2_score INTEGER,
+            q3_score INTEGER,
+            q4_score INTEGER,
+            q5_score INTEGER,
+            q6_score INTEGER,
+            q7_score INTEGER,
+            q8_score INTEGER,
+            q9_score INTEGER,
+            q10_score INTEGER
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_student_name ON observations(student_name)")
+
+    # Add and backfill the integer score columns on databases created before they existed
+    existing = {row[1] for row in c.execute("PRAGMA table_info(observations)")}
+    for q, (_, options) in questions.items():
+        if SCORE_COLS[q] not in existing:
+            c.execute(f"ALTER TABLE observations ADD COLUMN {SCORE_COLS[q]} INTEGER")
+            c.execute(f"UPDATE observations SET {SCORE_COLS[q]} = {score_case_sql(q, options)}")
     conn.commit()
+    return conn
+
+@st.cache_resource
+def get_db_lock():
+    """Serializes reads and writes on the shared connection, which every session's script thread uses."""
+    return threading.Lock()
+
+conn = init_db()
+db_lock = get_db_lock()
+
+@st.cache_resource
+def db_version_holder():
+    """Process-wide write counter; cached reads below are keyed on it, so it is shared by every session."""
+    return {"version": 0}
+
+def db_version():
+    """Returns the current write counter."""
+    return db_version_holder()["version"]
+
+def bump_db_version():
+    """Marks cached query results as stale after a write, for every session."""
+    with db_lock:
+        db_version_holder()["version"] += 1
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def list_students(version):
+    """Returns the distinct student names; cached until db_version changes."""
+    with db_lock:
+        c = conn.cursor()
+        return [r[0] for r in c.execute("SELECT DISTINCT student_name FROM observations ORDER BY student_name").fetchall()]
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def student_history_ids(student, version):
+    """Returns (id, timestamp) pairs for one student's observations, newest first."""
+    with db_lock:
+        c = conn.cursor()
+        rows = c.execute("SELECT id, timestamp FROM observations WHERE student_name = ? ORDER BY timestamp DESC",
+                         (student,)).fetchall()
+    return [tuple(r) for r in rows]
+
+def get_observation(obs_id):
+    """Fetches a single observation by primary key as a dict; None if it no longer exists."""
+    with db_lock:
+        c = conn.cursor()
+        row = c.execute("SELECT * FROM observations WHERE id = ?", (obs_id,)).fetchone()
+    return dict(row) if row is not None else None
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def class_averages(version):
+    """Computes per-question class averages from the stored scores; None if there is no data."""
+    avg_exprs = ", ".join(f"AVG({col})" for col in SCORE_COLS.values())
+    with db_lock:
+        c = conn.cursor()
+        row = c.execute(f"SELECT COUNT(*), {avg_exprs} FROM observations").fetchone()
+    if row[0] == 0:
+        return None
+    return list(row[1:])
+
+def save_observations(rows):
+    """Inserts one or more observations (dicts) in a single transaction."""
+    cols_list = ["student_name"] + list(questions.keys()) + list(SCORE_COLS.values())
+    cols = ", ".join(cols_list)
+    placeholders = ", ".join(["?"] * len(cols_list))
+    merged_rows = [{**r, **score_columns(r)} for r in rows]
+    with db_lock, conn:
+        conn.executemany(f"INSERT INTO observations ({cols}) VALUES ({placeholders})",
+                         [tuple(m[c] for c in cols_list) for m in merged_rows])
+    bump_db_version()
+
+def delete_observation(obs_id):
+    """Deletes a record from the database by ID."""
+    with db_lock:
+        c = conn.cursor()
+        c.execute("DELETE FROM observations WHERE id = ?", (obs_id,))
+        conn.commit()
+    bump_db_version()
 
 def update_observation(obs_id, responses):
     """Updates an existing record in the database."""
-    c = conn.cursor()
+    # Keep the stored integer scores in step with the edited responses
+    responses = {**responses, **score_columns(responses)}
     
     # Construct the SET clause for the SQL query
     set_clauses = [f"{col} = ?" for col in responses.keys()]
@@ -147,8 +251,11 @@ def update_observation(obs_id, responses):
     values = list(responses.values())
     values.append(obs_id)
     
-    c.execute(f"UPDATE observations SET {set_query} WHERE id = ?", values)
-    conn.commit()
+    with db_lock:
+        c = conn.cursor()
+        c.execute(f"UPDATE observations SET {set_query} WHERE id = ?", values)
+        conn.commit()
+    bump_db_version()
 
 
 # ==========================================
@@ -183,16 +290,11 @@ with tab_live:
         if submit_button:
             if student_name.strip():
                 # 1. Save Data to Database
-                c = conn.cursor()
-                cols = ", ".join(["student_name"] + list(responses.keys()))
-                placeholders = ", ".join(["?"] * (len(responses) + 1))
-                values = [student_name] + list(responses.values())
-                c.execute(f"INSERT INTO observations ({cols}) VALUES ({placeholders})", values)
-                conn.commit()
+                save_observations([{"student_name": student_name, **responses}])
                 st.success(f"✅ Observation for *{student_name}* saved successfully! Charts below reflect this submission.")
                 
                 # 2. Calculate Scores
-                student_scores = [get_score(responses[col]) for col in questions.keys()]
+                student_scores = score_responses(responses)
                 
                 # 3. Display Charts instantly
                 st.markdown("---")
@@ -200,12 +302,12 @@ with tab_live:
                 col_radar, col_bar = st.columns([1, 1.5])
                 
                 with col_radar:
-                    radar_fig = create_radar_chart(student_scores, "Skill Profile (Radar Chart)", '#2196F3', student_name)
+                    radar_fig = create_radar_chart(tuple(student_scores), "Skill Profile (Radar Chart)", '#2196F3', student_name)
                     st.pyplot(radar_fig)
 
                 with col_bar:
-                    bar_fig = create_bar_chart(student_scores, "Performance Breakdown")
-                    st.pyplot(bar_fig)
+                    bar_chart = create_bar_chart(student_scores, "Performance Breakdown")
+                    st.altair_chart(bar_chart)
 
             else:
                 st.error("⚠ Please enter a student name before saving.")
@@ -218,17 +320,18 @@ with tab_live:
 # -------------------------------
 with tab_student:
     st.subheader("Individual Student Analysis & Management")
-    df = pd.read_sql("SELECT * FROM observations", conn)
+    # Read the version once so every cached query below sees the same snapshot
+    version = db_version()
+    students = list_students(version)
     
-    if df.empty:
+    if not students:
         st.info("Waiting for data... Please add observations first.")
     else:
         # Display list of all observations for the selected student
-        students = df['student_name'].unique()
         selected_student = st.selectbox("Select Student", students, key="select_student_mgmt")
         
-        # Get all observations for the student and sort by timestamp
-        student_history = df[df['student_name'] == selected_student].sort_values(by='timestamp', ascending=False)
+        # Get all observations for the student, newest first
+        student_history = student_history_ids(selected_student, version)
         
         st.markdown("---")
         
@@ -236,17 +339,18 @@ with tab_student:
         st.markdown("#### Select Observation for Charting/Management")
         
         # Create a display string for each observation (Timestamp and ID)
-        history_options = {
-            row['id']: f"{row['timestamp']} (ID: {row['id']})"
-            for index, row in student_history.iterrows()
-        }
+        history_options = {obs_id: f"{ts} (ID: {obs_id})" for obs_id, ts in student_history}
         
         selected_id = st.selectbox("Choose an Observation:", list(history_options.keys()), 
                                    format_func=lambda x: history_options[x], 
                                    key="selected_obs_id")
 
         # Retrieve the selected observation row
-        student_data_row = df[df['id'] == selected_id].iloc[0]
+        student_data_row = get_observation(selected_id)
+        if student_data_row is None:
+            bump_db_version() # Drop the cached history that still lists this record
+            st.info(f"Record ID {selected_id} no longer exists. Please refresh the page to update the dashboard.")
+            st.stop()
         timestamp_str = pd.to_datetime(student_data_row['timestamp']).strftime('%Y-%m-%d %H:%M')
         
         col1, col2 = st.columns([1, 1.5])
@@ -266,7 +370,7 @@ with tab_student:
             with st.form(f"edit_form_{selected_id}"):
                 edit_responses = {}
                 for key, (label, options) in questions.items():
-                    # Get the current value from the dataframe row to set as default
+                    # Get the current value from the observation row to set as default
                     current_value = student_data_row[key]
                     st.write(f"**{label}**")
                     # Set the index of the current value for the radio button default
@@ -284,20 +388,19 @@ with tab_student:
 
         # --- Chart Display for Selected Observation ---
         with col2:
-            # Calculate scores
-            score_cols = list(questions.keys())
-            student_scores = [get_score(student_data_row[col]) for col in score_cols]
+            # Read the scores stored alongside the responses
+            student_scores = [student_data_row[SCORE_COLS[q]] for q in questions]
             
             st.markdown("#### Observation Charts")
             chart_col_1, chart_col_2 = st.columns([1, 1.5])
             
             with chart_col_1:
-                radar_fig = create_radar_chart(student_scores, "Skill Profile (Radar)", '#2196F3', selected_student)
+                radar_fig = create_radar_chart(tuple(student_scores), "Skill Profile (Radar)", '#2196F3', selected_student)
                 st.pyplot(radar_fig)
 
             with chart_col_2:
-                bar_fig = create_bar_chart(student_scores, "Performance Breakdown")
-                st.pyplot(bar_fig)
+                bar_chart = create_bar_chart(student_scores, "Performance Breakdown")
+                st.altair_chart(bar_chart)
 
 
 # -------------------------------
@@ -305,23 +408,21 @@ with tab_student:
 # -------------------------------
 with tab_class:
     st.subheader("Overall Class Analysis")
-    df = pd.read_sql("SELECT * FROM observations", conn)
+    avg_scores = class_averages(version)
     
     # This chart dynamically reflects ALL data, including new/edited/deleted observations.
-    if df.empty:
+    if avg_scores is None:
         st.info("Waiting for data... Please add observations first.")
     else:
-        avg_scores = [df[col].apply(get_score).mean() for col in questions.keys()]
-        
         st.markdown("**Showing Class Average Across All Observations**")
         col_radar, col_bar = st.columns([1, 1.5])
         
         with col_radar:
-            radar_fig = create_radar_chart(avg_scores, "Class Average Skill Profile", '#FF5252', "Class Average")
+            radar_fig = create_radar_chart(tuple(avg_scores), "Class Average Skill Profile", '#FF5252', "Class Average")
             st.pyplot(radar_fig)
             
         with col_bar:
-            bar_fig = create_bar_chart(avg_scores, "Class Average Breakdown")
-            st.pyplot(bar_fig)
+            bar_chart = create_bar_chart(avg_scores, "Class Average Breakdown")
+            st.altair_chart(bar_chart)
             
         st.info("💡 Any changes (new, edited, or deleted observations) instantly update these Class Average charts.")
\ No newline at end of file